@@ -7,15 +7,395 @@ Created for samass HA recovery - 2025-09-10
 
 import os
 import re
-import json
 import yaml
 from pathlib import Path
 from collections import defaultdict, Counter
+from itertools import chain
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
 import hashlib
+import sqlite3
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml C bindings, ~10x faster
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import blake3  # Optional: SIMD/multithreaded hashing, much faster than MD5
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson  # Optional: Rust/SIMD JSON serializer, ~5-10x faster than json
+except ImportError:
+    orjson = None
+    import json
+
+try:
+    import re2  # Optional: google-re2, matches all content signatures in one DFA pass
+except ImportError:
+    re2 = None
+
+# Files above this size are only listed, never opened
+LARGE_FILE_BYTES = 10 * 1024 * 1024  # 10MB
+
+# Files above this size are hashed in the main process with blake3's
+# multithreaded mode; smaller ones single-threaded in the pool workers
+HASH_THREADS_MIN_BYTES = 1024 * 1024  # 1MB
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Classification cache reused across runs; rows are committed in batches
+CACHE_FILE = ".ha_recovery_cache.db"
+CACHE_COMMIT_ROWS = 1000
+
+# Only the head of each candidate file is read to look for HA signatures
+SNIFF_BYTES = 2048
+
+# O_NOATIME (Linux) stops every sniff from writing an access time back to the
+# recovery drive; O_BINARY is needed on Windows
+SNIFF_FLAGS = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+SNIFF_NOATIME = getattr(os, 'O_NOATIME', 0)
+
+# Extensions worth sniffing for HA content ('' = no extension, common in PhotoRec output)
+TEXT_EXTENSIONS = frozenset({'.txt', '.yaml', '.yml', '.json', '.conf', '.cfg', '.py', ''})
+
+# Compiled at module scope so pool workers get them for free (fork) or
+# rebuild them once on import (Windows spawn)
+HA_FILENAME_PATTERNS = {
+    'configuration': re.compile(r'configuration\.ya?ml', re.IGNORECASE),
+    'automations': re.compile(r'automations?\.ya?ml', re.IGNORECASE),
+    'scenes': re.compile(r'scenes?\.ya?ml', re.IGNORECASE),
+    'secrets': re.compile(r'secrets?\.ya?ml', re.IGNORECASE),
+    'groups': re.compile(r'groups?\.ya?ml', re.IGNORECASE),
+    'customize': re.compile(r'customize\.ya?ml', re.IGNORECASE),
+    'known_devices': re.compile(r'known_devices\.ya?ml', re.IGNORECASE),
+    'scripts': re.compile(r'scripts?\.ya?ml', re.IGNORECASE)
+}
+
+# Content signatures are bytes patterns so the sniff buffer is never decoded
+HA_CONTENT_PATTERNS = {
+    'homeassistant': re.compile(rb'homeassistant:', re.MULTILINE),
+    'automation': re.compile(rb'- alias:|trigger:|action:|condition:', re.MULTILINE),
+    'sensor': re.compile(rb'sensor:|platform:', re.MULTILINE),
+    'switch': re.compile(rb'switch:|platform:', re.MULTILINE),
+    'light': re.compile(rb'light:|platform:', re.MULTILINE),
+    'device_tracker': re.compile(rb'device_tracker:', re.MULTILINE),
+    'esp_device': re.compile(rb'esphome|esp32|esp8266', re.IGNORECASE),
+    'integration': re.compile(rb'integration:|component:', re.MULTILINE)
+}
+
+
+def _categorize(match_type):
+    """Map a match type to its results bucket"""
+    if 'configuration' in match_type:
+        return 'ha_configs'
+    elif 'automation' in match_type:
+        return 'automations'
+    elif 'scene' in match_type:
+        return 'scenes'
+    elif 'secret' in match_type:
+        return 'secrets'
+    return 'yaml_files'
+
+
+# Match type strings and their buckets, built once instead of per file
+FILENAME_MATCH_TYPES = {name: f"filename_match_{name}" for name in HA_FILENAME_PATTERNS}
+CONTENT_MATCH_TYPES = {name: f"content_match_{name}" for name in HA_CONTENT_PATTERNS}
+MATCH_CATEGORIES = {
+    match_type: _categorize(match_type)
+    for match_type in (*FILENAME_MATCH_TYPES.values(), *CONTENT_MATCH_TYPES.values())
+}
+
+
+def _combine_patterns(patterns):
+    """Fold a dict of named patterns into one alternation of named groups"""
+    is_bytes = isinstance(next(iter(patterns.values())).pattern, bytes)
+    parts = []
+    for name, pattern in patterns.items():
+        source = pattern.pattern
+        if is_bytes:
+            source = source.decode('ascii')
+        if pattern.flags & re.IGNORECASE:
+            source = f'(?i:{source})'
+        parts.append(f'(?P<{name}>{source})')
+    combined = '|'.join(parts)
+    if is_bytes:
+        combined = combined.encode('ascii')
+    return re.compile(combined, re.MULTILINE)
+
+
+# One regex scan per group instead of one per pattern
+HA_FILENAME_RE = _combine_patterns(HA_FILENAME_PATTERNS)
+HA_CONTENT_RE = _combine_patterns(HA_CONTENT_PATTERNS)
+
+
+def _first_match(combined, patterns, text):
+    """Return the name of the first pattern (in dict order) matching text"""
+    match = combined.search(text)
+    if match is None:
+        return None
+    # The alternation reports the leftmost hit, but an earlier pattern may
+    # still match further along - keep the original priority order
+    for name, pattern in patterns.items():
+        if name == match.lastgroup or pattern.search(text):
+            return name
+
+
+def _build_re2_set(patterns):
+    """Compile patterns into an RE2 Set, or None if google-re2 is missing"""
+    if re2 is None:
+        return None
+    pattern_set = re2.Set.SearchSet(re2.Options())
+    for pattern in patterns.values():
+        source = pattern.pattern
+        if pattern.flags & re.IGNORECASE:
+            source = b'(?i)' + source
+        pattern_set.Add(source)
+    pattern_set.Compile()
+    return pattern_set
+
+
+HA_CONTENT_SET = _build_re2_set(HA_CONTENT_PATTERNS)
+HA_CONTENT_NAMES = list(HA_CONTENT_PATTERNS)
+
+
+def _match_content(content):
+    """Return the highest-priority content signature found in content"""
+    if HA_CONTENT_SET is not None:
+        # Set indices follow dict order, so the lowest index wins
+        matched = HA_CONTENT_SET.Match(content)
+        return HA_CONTENT_NAMES[min(matched)] if matched else None
+    return _first_match(HA_CONTENT_RE, HA_CONTENT_PATTERNS, content)
+
+
+def _new_hasher(threaded=False):
+    """Create a fast hasher for duplicate detection (BLAKE3 or BLAKE2 fallback)
+
+    Only pass threaded=True outside the pool, or every worker would spawn
+    its own set of blake3 threads.
+    """
+    if blake3 is None:
+        return hashlib.blake2b()
+    if threaded:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return blake3.blake3()
+
+
+# One read buffer per process, shared by every _get_file_hash call
+_hash_buf = None
+
+
+def _hash_buffer():
+    """Return this process's (bytearray, memoryview) hash read buffer"""
+    global _hash_buf
+    if _hash_buf is None:
+        buf = bytearray(HASH_CHUNK_BYTES)
+        _hash_buf = (buf, memoryview(buf))
+    return _hash_buf
+
+
+def _get_file_hash(file_path, threaded=False):
+    """Generate BLAKE3 (or BLAKE2 fallback) hash for duplicate detection"""
+    try:
+        hasher = _new_hasher(threaded)
+        buf, view = _hash_buffer()
+        with open(file_path, 'rb', buffering=0) as f:
+            while (n := f.readinto(buf)):
+                hasher.update(view[:n])
+        return hasher.hexdigest()
+    except:
+        return None
+
+
+def _sniff(file_path):
+    """Read the first SNIFF_BYTES of a file with plain os-level calls"""
+    try:
+        fd = os.open(file_path, SNIFF_FLAGS | SNIFF_NOATIME)
+    except PermissionError:
+        if not SNIFF_NOATIME:
+            raise
+        fd = os.open(file_path, SNIFF_FLAGS)  # O_NOATIME needs file ownership
+    try:
+        return os.read(fd, SNIFF_BYTES)
+    finally:
+        os.close(fd)
+
+
+def _is_likely_ha_file(file_path):
+    """Check if file is likely a Home Assistant configuration"""
+    try:
+        # Check filename patterns first
+        filename = os.path.basename(file_path).lower()
+        pattern_name = _first_match(HA_FILENAME_RE, HA_FILENAME_PATTERNS, filename)
+        if pattern_name:
+            return True, FILENAME_MATCH_TYPES[pattern_name]
+        
+        # Check file content (raw bytes - the signatures are all ASCII)
+        content = _sniff(file_path)  # Read first 2KB for performance
+        
+        pattern_name = _match_content(content)
+        if pattern_name:
+            return True, CONTENT_MATCH_TYPES[pattern_name]
+        
+        return False, "no_match"
+    except:
+        return False, "read_error"
+
+
+def _walk(root):
+    """Yield (DirEntry, parent folder name) for every file under root
+
+    Symlinked folders are not followed. The folder name is carried along
+    with each directory so files don't need a Path.parent lookup.
+    """
+    stack = [(os.fspath(root), Path(root).name)]
+    while stack:
+        directory, dir_name = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, entry.name))
+                        elif entry.is_file():
+                            yield entry, dir_name
+                    except OSError:
+                        continue
+        except OSError:
+            continue  # Unreadable folder - skip it like rglob does
+
+
+def _suffix(name):
+    """Lower-cased extension of a file name (same rules as Path.suffix)"""
+    dot = name.rfind('.')
+    if 0 < dot < len(name) - 1:
+        return name[dot:].lower()
+    return ''
+
+
+def _classify_file(path_str):
+    """Classify a single recovered text file (runs in a worker process)
+
+    Returns (match_type, category) where category names the results bucket
+    the file belongs in, or is None if the file is not interesting.
+    """
+    is_ha, match_type = _is_likely_ha_file(path_str)
+    if is_ha:
+        return match_type, MATCH_CATEGORIES[match_type]
+    if _suffix(os.path.basename(path_str)) == '.json':
+        return match_type, 'json_files'
+    return match_type, None
+
+
+def _make_file_info(path_str, name, subfolder, file_size, match_type, category, file_hash=None):
+    """Build the results entry for a classified file"""
+    if category == 'json_files':
+        return {
+            'path': path_str,
+            'name': name,
+            'size': file_size,
+            'subfolder': subfolder
+        }
+    return {
+        'path': path_str,
+        'name': name,
+        'size': file_size,
+        'match_type': match_type,
+        'hash': file_hash,  # Only set for files sharing a size
+        'subfolder': subfolder  # Track which subfolder
+    }
+
+
+def _cache_version():
+    """Identify the hasher and classification rules that produce cache rows"""
+    hasher = 'blake3' if blake3 is not None else 'blake2b'
+    rules = repr((
+        [(name, p.pattern, p.flags) for name, p in HA_FILENAME_PATTERNS.items()],
+        [(name, p.pattern, p.flags) for name, p in HA_CONTENT_PATTERNS.items()],
+        sorted(TEXT_EXTENSIONS),
+        LARGE_FILE_BYTES,
+        SNIFF_BYTES,
+    ))
+    return f"{hasher}:{hashlib.sha256(rules.encode()).hexdigest()[:16]}"
+
+
+class ClassificationCache:
+    """On-disk (path, mtime, size) -> classification cache for re-runs
+
+    Rows are only valid for the hasher and patterns that produced them, so
+    the whole table is dropped when _cache_version() changes.
+    """
+
+    def __init__(self, db_path, version=None):
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, "
+                "match_type TEXT, hash TEXT, category TEXT)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            
+            version = version or _cache_version()
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self.conn.execute("DELETE FROM files")
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self._rows = []
+        self._hashes = []
+
+    def get(self, path_str, mtime, size):
+        """Return (match_type, hash, category) if the file is unchanged, else None"""
+        row = self.conn.execute(
+            "SELECT mtime, size, match_type, hash, category FROM files WHERE path = ?",
+            (path_str,)
+        ).fetchone()
+        if row is None or row[0] != mtime or row[1] != size:
+            return None
+        return row[2:]
+
+    def put(self, path_str, mtime, size, match_type, category):
+        """Queue a fresh classification for writing"""
+        self._rows.append((path_str, mtime, size, match_type, None, category))
+        if len(self._rows) >= CACHE_COMMIT_ROWS:
+            self.flush()
+
+    def set_hash(self, path_str, file_hash):
+        """Queue a computed hash for an already classified file"""
+        self._hashes.append((file_hash, path_str))
+        if len(self._hashes) >= CACHE_COMMIT_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Write queued rows and hashes in one transaction"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", self._rows)
+            self.conn.executemany("UPDATE files SET hash = ? WHERE path = ?", self._hashes)
+        self._rows.clear()
+        self._hashes.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def dumps(obj):
+    """Serialize results to indented JSON (Paths and other objects via str)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, default=str, indent=2)
+
+
+def _largest_first(files):
+    """Sort file infos by size, largest first"""
+    return sorted(files, key=itemgetter('size'), reverse=True)
+
 
 class HARecoveryAnalyzer:
-    def __init__(self, recovery_folder):
+    def __init__(self, recovery_folder, cache_path=CACHE_FILE):
         self.recovery_folder = Path(recovery_folder)
+        self.cache_path = cache_path  # None disables the classification cache
         self.results = {
             'ha_configs': [],
             'yaml_files': [],
@@ -24,66 +404,28 @@ class HARecoveryAnalyzer:
             'automations': [],
             'scenes': [],
             'secrets': [],
-            'duplicates': defaultdict(list),
+            'duplicates': {},  # hash -> files, only for hashes seen more than once
             'large_files': [],
             'suspicious_files': []
         }
         
+        # First file seen per hash; promoted into duplicates on a second hit
+        self._first_seen = {}
+        
         # Home Assistant file patterns
-        self.ha_patterns = {
-            'configuration': re.compile(r'configuration\.ya?ml', re.IGNORECASE),
-            'automations': re.compile(r'automations?\.ya?ml', re.IGNORECASE),
-            'scenes': re.compile(r'scenes?\.ya?ml', re.IGNORECASE),
-            'secrets': re.compile(r'secrets?\.ya?ml', re.IGNORECASE),
-            'groups': re.compile(r'groups?\.ya?ml', re.IGNORECASE),
-            'customize': re.compile(r'customize\.ya?ml', re.IGNORECASE),
-            'known_devices': re.compile(r'known_devices\.ya?ml', re.IGNORECASE),
-            'scripts': re.compile(r'scripts?\.ya?ml', re.IGNORECASE)
-        }
+        self.ha_patterns = HA_FILENAME_PATTERNS
         
         # HA content signatures
-        self.ha_content_patterns = {
-            'homeassistant': re.compile(r'homeassistant:', re.MULTILINE),
-            'automation': re.compile(r'- alias:|trigger:|action:|condition:', re.MULTILINE),
-            'sensor': re.compile(r'sensor:|platform:', re.MULTILINE),
-            'switch': re.compile(r'switch:|platform:', re.MULTILINE),
-            'light': re.compile(r'light:|platform:', re.MULTILINE),
-            'device_tracker': re.compile(r'device_tracker:', re.MULTILINE),
-            'esp_device': re.compile(r'esphome|esp32|esp8266', re.IGNORECASE),
-            'integration': re.compile(r'integration:|component:', re.MULTILINE)
-        }
+        self.ha_content_patterns = HA_CONTENT_PATTERNS
 
-    def get_file_hash(self, file_path):
-        """Generate MD5 hash for duplicate detection"""
-        try:
-            hasher = hashlib.md5()
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
-        except:
-            return None
+    def get_file_hash(self, file_path, file_size=None):
+        """Generate BLAKE3 (or BLAKE2 fallback) hash for duplicate detection"""
+        threaded = file_size is not None and file_size > HASH_THREADS_MIN_BYTES
+        return _get_file_hash(file_path, threaded)
 
     def is_likely_ha_file(self, file_path):
         """Check if file is likely a Home Assistant configuration"""
-        try:
-            # Check filename patterns first
-            filename = file_path.name.lower()
-            for pattern_name, pattern in self.ha_patterns.items():
-                if pattern.search(filename):
-                    return True, f"filename_match_{pattern_name}"
-            
-            # Check file content
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read(2048)  # Read first 2KB for performance
-                
-                for pattern_name, pattern in self.ha_content_patterns.items():
-                    if pattern.search(content):
-                        return True, f"content_match_{pattern_name}"
-                        
-            return False, "no_match"
-        except:
-            return False, "read_error"
+        return _is_likely_ha_file(file_path)
 
     def analyze_yaml_file(self, file_path):
         """Analyze YAML file structure"""
@@ -93,7 +435,7 @@ class HARecoveryAnalyzer:
                 
             # Try to parse as YAML
             try:
-                yaml_data = yaml.safe_load(content)
+                yaml_data = yaml.load(content, Loader=SafeLoader)
                 return {
                     'valid_yaml': True,
                     'structure': type(yaml_data).__name__,
@@ -123,157 +465,211 @@ class HARecoveryAnalyzer:
             if len(subfolders) > 5:
                 print(f"   ... and {len(subfolders) - 5} more folders")
         
+        print(f"🔄 Starting recursive scan...")
+        cache = ClassificationCache(self.cache_path) if self.cache_path else None
+        try:
+            file_count, ha_count = self._scan(cache)
+        finally:
+            if cache is not None:
+                cache.close()
+        
+        print(f"✅ Scan complete! Processed {file_count} files, found {ha_count} HA-related files")
+        print(f"📈 Success rate: {ha_count/file_count*100:.3f}% of files were HA-related")
+
+    def _scan(self, cache):
+        """Walk, classify and hash; returns (file_count, ha_count)"""
         file_count = 0
         ha_count = 0
         
-        # Get all text files recursively
-        text_extensions = {'.txt', '.yaml', '.yml', '.json', '.conf', '.cfg', '.py'}
-        
-        print(f"🔄 Starting recursive scan...")
-        for file_path in self.recovery_folder.rglob('*'):
-            if not file_path.is_file():
-                continue
-                
+        # Unchanged files come straight from the cache; the rest are collected
+        # up front and fanned out to a pool
+        classified = []  # (path, name, subfolder, size, match_type, hash, category)
+        cache_hits = 0
+        pending = []  # (path, name, subfolder, size, mtime)
+        for entry, dir_name in _walk(self.recovery_folder):
             file_count += 1
             if file_count % 5000 == 0:
-                print(f"   📊 Processed {file_count} files, found {ha_count} HA-related files...")
+                print(f"   📊 Scanned {file_count} files, {len(pending)} text files to inspect...")
             
-            # Skip very large files initially
+            # Check if it's a text file (or HA-named) before stat'ing or opening it
+            name = entry.name
+            dot = name.rfind('.')  # Inlined _suffix() - this loop sees every file
+            suffix = name[dot:].lower() if 0 < dot < len(name) - 1 else ''
+            if suffix not in TEXT_EXTENSIONS and not HA_FILENAME_RE.search(name):
+                continue
+            
+            # Skip very large files initially (DirEntry caches the stat result)
             try:
-                file_size = file_path.stat().st_size
-                if file_size > 10 * 1024 * 1024:  # 10MB
-                    self.results['large_files'].append({
-                        'path': str(file_path),
-                        'size': file_size
-                    })
-                    continue
-            except:
+                stat = entry.stat()
+            except OSError:
                 continue
+            file_size = stat.st_size
+            if file_size > LARGE_FILE_BYTES:
+                self.results['large_files'].append({
+                    'path': entry.path,
+                    'size': file_size
+                })
+                continue
+            
+            if cache is not None:
+                cached = cache.get(entry.path, stat.st_mtime_ns, file_size)
+                if cached is not None:
+                    cache_hits += 1
+                    if cached[2] is not None:
+                        classified.append((entry.path, name, dir_name, file_size, *cached))
+                    continue
             
-            # Check if it's a text file
-            if file_path.suffix.lower() in text_extensions or file_path.suffix == '':
-                is_ha, match_type = self.is_likely_ha_file(file_path)
+            pending.append((entry.path, name, dir_name, file_size, stat.st_mtime_ns))
+        
+        if cache is not None:
+            print(f"   💾 {cache_hits} files unchanged since the last run, {len(pending)} to inspect")
+        
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(_classify_file, [item[0] for item in pending], chunksize=256)
+            for i, (match_type, category) in enumerate(results):
+                if (i + 1) % 5000 == 0:
+                    print(f"   📊 Inspected {i + 1}/{len(pending)} files...")
                 
-                if is_ha:
+                path_str, name, dir_name, file_size, mtime = pending[i]
+                if cache is not None and match_type != "read_error":
+                    cache.put(path_str, mtime, file_size, match_type, category)
+                if category is not None:
+                    classified.append((path_str, name, dir_name, file_size, match_type, None, category))
+            
+            # HA files grouped by size; only files sharing a size can be duplicates
+            by_size = defaultdict(list)
+            for path_str, name, dir_name, file_size, match_type, file_hash, category in classified:
+                file_info = _make_file_info(path_str, name, dir_name, file_size, match_type, category, file_hash)
+                self.results[category].append(file_info)
+                if category != 'json_files':
                     ha_count += 1
-                    file_info = {
-                        'path': str(file_path),
-                        'name': file_path.name,
-                        'size': file_size,
-                        'match_type': match_type,
-                        'hash': self.get_file_hash(file_path),
-                        'subfolder': file_path.parent.name  # Track which subfolder
-                    }
-                    
-                    # Categorize by type
-                    if 'configuration' in match_type:
-                        self.results['ha_configs'].append(file_info)
-                    elif 'automation' in match_type:
-                        self.results['automations'].append(file_info)
-                    elif 'scene' in match_type:
-                        self.results['scenes'].append(file_info)
-                    elif 'secret' in match_type:
-                        self.results['secrets'].append(file_info)
-                    else:
-                        self.results['yaml_files'].append(file_info)
-                    
-                    # Check for duplicates
-                    if file_info['hash']:
-                        self.results['duplicates'][file_info['hash']].append(file_info)
-                
-                elif file_path.suffix.lower() == '.json':
-                    self.results['json_files'].append({
-                        'path': str(file_path),
-                        'name': file_path.name,
-                        'size': file_size,
-                        'subfolder': file_path.parent.name
-                    })
+                    by_size[file_size].append(file_info)
+            
+            # Check for duplicates - hash only files whose size collides
+            candidates = [info for group in by_size.values() if len(group) > 1 for info in group]
+            to_hash = [info for info in candidates if info['hash'] is None]
+            print(f"🔑 Hashing {len(to_hash)} of {ha_count} HA files with a shared size...")
+            
+            # Small files hash single-threaded across the pool; large ones hash
+            # here one at a time with blake3's own threads, so the two never stack
+            small = [info for info in to_hash if info['size'] <= HASH_THREADS_MIN_BYTES]
+            large = [info for info in to_hash if info['size'] > HASH_THREADS_MIN_BYTES]
+            hashes = executor.map(_get_file_hash, [info['path'] for info in small], chunksize=64)
+            hashed = chain(
+                zip(small, hashes),
+                ((info, _get_file_hash(info['path'], threaded=True)) for info in large)
+            )
+            for file_info, file_hash in hashed:
+                file_info['hash'] = file_hash
+                if cache is not None and file_hash:
+                    cache.set_hash(file_info['path'], file_hash)
+            
+            for file_info in candidates:
+                if file_info['hash']:
+                    self._record_hash(file_info['hash'], file_info)
         
-        print(f"✅ Scan complete! Processed {file_count} files, found {ha_count} HA-related files")
-        print(f"📈 Success rate: {ha_count/file_count*100:.3f}% of files were HA-related")
+        return file_count, ha_count
+
+    def _record_hash(self, file_hash, file_info):
+        """Track a hashed file, only materializing lists for real duplicates"""
+        first = self._first_seen.get(file_hash)
+        if first is None:
+            self._first_seen[file_hash] = file_info
+        elif file_hash in self.results['duplicates']:
+            self.results['duplicates'][file_hash].append(file_info)
+        else:
+            self.results['duplicates'][file_hash] = [first, file_info]
 
     def generate_report(self):
         """Generate detailed analysis report"""
-        report = []
-        report.append("# Home Assistant Recovery Analysis Report")
-        report.append(f"Generated: {os.getcwd()}")
-        report.append(f"Scanned folder: {self.recovery_folder}")
-        report.append("")
+        return "\n".join(self.iter_report())
+
+    def iter_report(self):
+        """Yield the analysis report line by line"""
+        yield "# Home Assistant Recovery Analysis Report"
+        yield f"Generated: {os.getcwd()}"
+        yield f"Scanned folder: {self.recovery_folder}"
+        yield ""
         
         # Summary
-        report.append("## Summary")
-        report.append(f"- Configuration files: {len(self.results['ha_configs'])}")
-        report.append(f"- Automation files: {len(self.results['automations'])}")
-        report.append(f"- Scene files: {len(self.results['scenes'])}")
-        report.append(f"- Secret files: {len(self.results['secrets'])}")
-        report.append(f"- Other YAML files: {len(self.results['yaml_files'])}")
-        report.append(f"- JSON files: {len(self.results['json_files'])}")
-        report.append(f"- Large files (>10MB): {len(self.results['large_files'])}")
-        report.append("")
+        yield "## Summary"
+        yield f"- Configuration files: {len(self.results['ha_configs'])}"
+        yield f"- Automation files: {len(self.results['automations'])}"
+        yield f"- Scene files: {len(self.results['scenes'])}"
+        yield f"- Secret files: {len(self.results['secrets'])}"
+        yield f"- Other YAML files: {len(self.results['yaml_files'])}"
+        yield f"- JSON files: {len(self.results['json_files'])}"
+        yield f"- Large text files (>10MB): {len(self.results['large_files'])}"
+        yield ""
         
         # Duplicates
-        duplicates = {k: v for k, v in self.results['duplicates'].items() if len(v) > 1}
-        report.append(f"## Duplicate Files ({len(duplicates)} sets)")
+        duplicates = self.results['duplicates']
+        yield f"## Duplicate Files ({len(duplicates)} sets)"
         for file_hash, files in duplicates.items():
-            report.append(f"### Hash: {file_hash[:8]}...")
+            yield f"### Hash: {file_hash[:8]}..."
             for file_info in files:
-                report.append(f"- {file_info['path']} ({file_info['size']} bytes)")
-            report.append("")
+                yield f"- {file_info['path']} ({file_info['size']} bytes)"
+            yield ""
         
         # Key files found
-        report.append("## Key Home Assistant Files")
+        yield "## Key Home Assistant Files"
         
         if self.results['ha_configs']:
-            report.append("### Configuration Files")
-            for file_info in sorted(self.results['ha_configs'], key=lambda x: x['size'], reverse=True):
-                report.append(f"- **{file_info['name']}** ({file_info['size']} bytes)")
-                report.append(f"  Path: `{file_info['path']}`")
-                report.append(f"  Subfolder: {file_info['subfolder']}")
-                report.append(f"  Match: {file_info['match_type']}")
-            report.append("")
+            yield "### Configuration Files"
+            for file_info in _largest_first(self.results['ha_configs']):
+                yield f"- **{file_info['name']}** ({file_info['size']} bytes)"
+                yield f"  Path: `{file_info['path']}`"
+                yield f"  Subfolder: {file_info['subfolder']}"
+                yield f"  Match: {file_info['match_type']}"
+            yield ""
         
         if self.results['automations']:
-            report.append("### Automation Files")
-            for file_info in sorted(self.results['automations'], key=lambda x: x['size'], reverse=True):
-                report.append(f"- **{file_info['name']}** ({file_info['size']} bytes)")
-                report.append(f"  Path: `{file_info['path']}`")
-                report.append(f"  Subfolder: {file_info['subfolder']}")
-            report.append("")
+            yield "### Automation Files"
+            for file_info in _largest_first(self.results['automations']):
+                yield f"- **{file_info['name']}** ({file_info['size']} bytes)"
+                yield f"  Path: `{file_info['path']}`"
+                yield f"  Subfolder: {file_info['subfolder']}"
+            yield ""
         
         # Recommendations
-        report.append("## Recovery Recommendations")
-        report.append("1. **Start with largest configuration files** - likely most complete")
-        report.append("2. **Check duplicates** - choose newest/largest version")
-        report.append("3. **Validate YAML syntax** before using")
-        report.append("4. **Review secrets files** - may need to regenerate tokens")
-        report.append("5. **Test automations** individually before bulk import")
-        
-        return "\n".join(report)
+        yield "## Recovery Recommendations"
+        yield "1. **Start with largest configuration files** - likely most complete"
+        yield "2. **Check duplicates** - choose newest/largest version"
+        yield "3. **Validate YAML syntax** before using"
+        yield "4. **Review secrets files** - may need to regenerate tokens"
+        yield "5. **Test automations** individually before bulk import"
 
     def save_file_list(self, filename):
         """Save prioritized file list for manual review"""
-        priority_files = []
+        with open(filename, 'w') as f:
+            f.writelines(f"{line}\n" for line in self.iter_priority_files())
         
+        print(f"📝 Priority file list saved to: {filename}")
+
+    def save_results(self, filename):
+        """Save the raw results as JSON for other tools"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(dumps(self.results))
+        
+        print(f"🧾 Results saved to: {filename}")
+
+    def iter_priority_files(self):
+        """Yield prioritized file list entries"""
         # Add configuration files (highest priority)
-        for file_info in sorted(self.results['ha_configs'], key=lambda x: x['size'], reverse=True):
-            priority_files.append(f"HIGH_PRIORITY: {file_info['path']}")
+        for file_info in _largest_first(self.results['ha_configs']):
+            yield f"HIGH_PRIORITY: {file_info['path']}"
         
         # Add automations
-        for file_info in sorted(self.results['automations'], key=lambda x: x['size'], reverse=True):
-            priority_files.append(f"AUTOMATION: {file_info['path']}")
+        for file_info in _largest_first(self.results['automations']):
+            yield f"AUTOMATION: {file_info['path']}"
         
         # Add secrets
-        for file_info in sorted(self.results['secrets'], key=lambda x: x['size'], reverse=True):
-            priority_files.append(f"SECRETS: {file_info['path']}")
+        for file_info in _largest_first(self.results['secrets']):
+            yield f"SECRETS: {file_info['path']}"
         
         # Add other YAML files
-        for file_info in sorted(self.results['yaml_files'], key=lambda x: x['size'], reverse=True):
-            priority_files.append(f"YAML: {file_info['path']}")
-        
-        with open(filename, 'w') as f:
-            f.write("\n".join(priority_files))
-        
-        print(f"📝 Priority file list saved to: {filename}")
+        for file_info in _largest_first(self.results['yaml_files']):
+            yield f"YAML: {file_info['path']}"
 
 def main():
     import sys
@@ -281,15 +677,21 @@ def main():
     # Default to samass's recovery folder if no argument provided
     default_recovery_folder = r"G:\My Drive\House Stuff\HomeAssistant\Corrupted image Sept 25\Recovery"
     
-    if len(sys.argv) == 1:
+    args = sys.argv[1:]
+    save_json = '--json' in args
+    if save_json:
+        args.remove('--json')
+    
+    if len(args) == 0:
         recovery_folder = default_recovery_folder
         print(f"Using default recovery folder: {recovery_folder}")
-    elif len(sys.argv) == 2:
-        recovery_folder = sys.argv[1]
+    elif len(args) == 1:
+        recovery_folder = args[0]
     else:
-        print("Usage: python analyze_recovered_files.py [recovery_folder]")
+        print("Usage: python analyze_recovered_files.py [--json] [recovery_folder]")
         print(f"Default: python analyze_recovered_files.py")
         print(f"Custom:  python analyze_recovered_files.py 'C:\\PhotoRec_Recovery\\recup_dir.1'")
+        print(f"JSON:    python analyze_recovered_files.py --json  (also writes ha_recovery_results.json)")
         sys.exit(1)
     
     if not os.path.exists(recovery_folder):
@@ -303,18 +705,19 @@ def main():
     analyzer = HARecoveryAnalyzer(recovery_folder)
     analyzer.scan_files()
     
-    # Generate report
-    report = analyzer.generate_report()
-    
     # Save files
     report_file = "ha_recovery_report.md"
     priority_file = "ha_priority_files.txt"
     
+    # Stream the report straight to disk rather than building one big string
     with open(report_file, 'w', encoding='utf-8') as f:
-        f.write(report)
+        f.writelines(f"{line}\n" for line in analyzer.iter_report())
     
     analyzer.save_file_list(priority_file)
     
+    if save_json:
+        analyzer.save_results("ha_recovery_results.json")
+    
     print(f"📊 Analysis complete!")
     print(f"📄 Report saved to: {report_file}")
     print(f"📋 Priority files saved to: {priority_file}")
@@ -9,7 +9,123 @@ import yaml
 import os
 import sys
 from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import re
+import hashlib
+import mmap
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml C bindings, ~10x faster
+except ImportError:
+    from yaml import SafeLoader
+
+# Files above this size are mmapped instead of read into memory
+MMAP_MIN_BYTES = 1024 * 1024  # 1MB
+SCAN_CHUNK = 1024 * 1024
+
+# Files above this size with strong signs of corruption are not worth a YAML parse
+CORRUPT_PARSE_MAX_BYTES = 4096
+
+# Bytes that suggest corrupted content. Control chars (other than \t \n \r)
+# and DEL are strong evidence and map to 1; \xC2/\xC3 (the UTF-8 lead bytes
+# of U+0080-U+00FF) map to 2 and only earn a warning, since Latin-1
+# characters such as the degree sign in '°C' are common in valid HA configs.
+CONTROL_BYTES = bytes(range(0x00, 0x09)) + b'\x0b\x0c' + bytes(range(0x0e, 0x20)) + b'\x7f'
+LATIN1_BYTES = b'\xc2\xc3'
+SUSPICIOUS_TABLE = bytes(
+    1 if b in CONTROL_BYTES else 2 if b in LATIN1_BYTES else 0 for b in range(256)
+)
+LETTER_RE = re.compile(rb'[a-zA-Z]')
+
+def _parse_yaml(content):
+    """Parse bytes or an mmap, dropping undecodable bytes like errors='ignore'"""
+    if isinstance(content, bytes):
+        return yaml.load(content.decode('utf-8', errors='ignore'), Loader=SafeLoader)
+    try:
+        return yaml.load(content, Loader=SafeLoader)  # mmap - read in place
+    except yaml.reader.ReaderError:
+        # Strict UTF-8 failed (e.g. a stray \xff) - retry leniently so the
+        # verdict doesn't depend on whether the file was mmapped
+        return yaml.load(content[:].decode('utf-8', errors='ignore'), Loader=SafeLoader)
+
+# One read buffer per process, shared by every _file_digest call
+_digest_buf = None
+
+def _digest_buffer():
+    """Return this process's (bytearray, memoryview) digest read buffer"""
+    global _digest_buf
+    if _digest_buf is None:
+        buf = bytearray(SCAN_CHUNK)
+        _digest_buf = (buf, memoryview(buf))
+    return _digest_buf
+
+def _file_digest(file_path):
+    """Content hash used to spot identical copies, or None if unreadable"""
+    try:
+        hasher = hashlib.blake2b(digest_size=16)
+        buf, view = _digest_buffer()
+        with open(file_path, 'rb', buffering=0) as f:
+            while (n := f.readinto(buf)):
+                hasher.update(view[:n])
+        return hasher.digest()
+    except OSError:
+        return None
+
+def _group_identical(file_paths, executor):
+    """Group indices of file_paths whose content is byte-identical
+
+    Only files sharing a size are hashed, spread across the executor's
+    workers; unreadable files stay on their own.
+    """
+    by_size = defaultdict(list)
+    for i, file_path in enumerate(file_paths):
+        try:
+            by_size[os.path.getsize(file_path)].append(i)
+        except OSError:
+            by_size[None, i].append(i)
+    
+    groups = [indices for indices in by_size.values() if len(indices) == 1]
+    colliding = [i for indices in by_size.values() if len(indices) > 1 for i in indices]
+    digests = executor.map(_file_digest, [file_paths[i] for i in colliding], chunksize=16)
+    
+    by_digest = defaultdict(list)
+    for i, digest in zip(colliding, digests):
+        if digest is None:
+            groups.append([i])
+        else:
+            by_digest[digest].append(i)
+    groups.extend(by_digest.values())
+    return groups
+
+def _count_lines(content):
+    """Count lines in bytes or an mmap without copying the whole buffer"""
+    if isinstance(content, bytes):
+        return content.count(b'\n') + 1
+    return sum(
+        content[i:i + SCAN_CHUNK].count(b'\n')
+        for i in range(0, len(content), SCAN_CHUNK)
+    ) + 1
+
+def _flagged_bytes(content):
+    """Return (has_control, has_latin1) from one C-level translate pass
+
+    Chunked so mmaps are never copied whole; stops at the first control byte.
+    """
+    has_latin1 = False
+    for i in range(0, len(content), SCAN_CHUNK):
+        flags = content[i:i + SCAN_CHUNK].translate(SUSPICIOUS_TABLE)
+        if b'\x01' in flags:
+            return True, has_latin1
+        has_latin1 = has_latin1 or b'\x02' in flags
+    return False, has_latin1
+
+def _is_too_small(content):
+    """True if the content holds fewer than 10 meaningful bytes"""
+    if isinstance(content, bytes):
+        return len(content.strip()) < 10
+    # mmapped files are over 1MB - only flag them if they are blank
+    return re.search(rb'\S', content) is None
 
 class HAYAMLValidator:
     def __init__(self):
@@ -27,13 +143,6 @@ class HAYAMLValidator:
             'device_tracker', 'group', 'input_boolean', 'input_number',
             'input_select', 'input_text', 'timer', 'counter', 'zone'
         }
-        
-        # Patterns that might indicate corrupted content
-        self.corruption_patterns = [
-            re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\xFF]'),  # Non-printable chars
-            re.compile(r'^[0-9\s]*$'),  # Only numbers and whitespace
-            re.compile(r'^[^a-zA-Z]*$'),  # No letters at all
-        ]
 
     def validate_file(self, file_path):
         """Validate a single YAML file"""
@@ -49,72 +158,111 @@ class HAYAMLValidator:
         }
         
         try:
-            # Read file
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            result['size'] = len(content)
-            result['lines'] = content.count('\n') + 1
-            
-            # Check for corruption patterns
-            for pattern in self.corruption_patterns:
-                if pattern.search(content):
-                    result['likely_corrupted'] = True
-                    result['warnings'].append("Contains suspicious patterns - may be corrupted")
-                    break
-            
-            # Skip very small files
-            if len(content.strip()) < 10:
-                result['warnings'].append("File too small to be meaningful")
-                return result
+            # Read file as raw bytes; large files are mmapped rather than copied
+            with open(file_path, 'rb') as f:
+                content = None
+                if os.fstat(f.fileno()).st_size > MMAP_MIN_BYTES:
+                    try:
+                        content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        pass  # Network/virtual drives may not support mmap
+                if content is None:
+                    content = f.read()
             
-            # Try to parse YAML
             try:
-                yaml_data = yaml.safe_load(content)
-                result['valid'] = True
-                
-                # Check if it looks like HA config
-                if isinstance(yaml_data, dict):
-                    found_sections = []
-                    for key in yaml_data.keys():
-                        if isinstance(key, str) and key.lower() in self.ha_sections:
-                            found_sections.append(key)
-                    result['ha_sections'] = found_sections
-                    
-                    if not found_sections:
-                        result['warnings'].append("No recognized HA sections found")
-                
-                elif isinstance(yaml_data, list):
-                    # Check if it's a list of automations/scripts
-                    if any(isinstance(item, dict) and 'alias' in item for item in yaml_data):
-                        result['ha_sections'] = ['automation_list']
-                    else:
-                        result['warnings'].append("List format - check if valid HA structure")
-                
-            except yaml.YAMLError as e:
-                result['error'] = f"YAML parsing error: {str(e)}"
-                
-                # Try to identify common issues
-                if "found character" in str(e):
-                    result['warnings'].append("Invalid characters - may be partially corrupted")
-                elif "expected" in str(e):
-                    result['warnings'].append("Syntax error - check indentation and structure")
+                self._check_content(content, result)
+            finally:
+                if isinstance(content, mmap.mmap):
+                    content.close()
             
         except Exception as e:
             result['error'] = f"File reading error: {str(e)}"
         
         return result
 
+    def _check_content(self, content, result):
+        """Scan and parse file content (bytes or mmap), filling in result"""
+        result['size'] = len(content)
+        result['lines'] = _count_lines(content)
+        
+        # Check for corruption patterns. No letters at all also counts (this
+        # covers files of only numbers and whitespace).
+        has_control, has_latin1 = _flagged_bytes(content)
+        no_letters = not has_control and LETTER_RE.search(content) is None
+        if has_control or has_latin1 or no_letters:
+            result['likely_corrupted'] = True
+            result['warnings'].append("Contains suspicious patterns - may be corrupted")
+        
+        # Skip very small files
+        if _is_too_small(content):
+            result['warnings'].append("File too small to be meaningful")
+            return
+        
+        # Skip the (expensive) parse only when the file is clearly garbage
+        if result['size'] > CORRUPT_PARSE_MAX_BYTES and (has_control or no_letters):
+            result['error'] = "YAML parsing skipped: file looks corrupted"
+            return
+        
+        # Try to parse YAML
+        try:
+            yaml_data = _parse_yaml(content)
+            result['valid'] = True
+            
+            # Check if it looks like HA config
+            if isinstance(yaml_data, dict):
+                found_sections = []
+                for key in yaml_data.keys():
+                    if isinstance(key, str) and key.lower() in self.ha_sections:
+                        found_sections.append(key)
+                result['ha_sections'] = found_sections
+                
+                if not found_sections:
+                    result['warnings'].append("No recognized HA sections found")
+            
+            elif isinstance(yaml_data, list):
+                # Check if it's a list of automations/scripts
+                if any(isinstance(item, dict) and 'alias' in item for item in yaml_data):
+                    result['ha_sections'] = ['automation_list']
+                else:
+                    result['warnings'].append("List format - check if valid HA structure")
+            
+        except yaml.YAMLError as e:
+            result['error'] = f"YAML parsing error: {str(e)}"
+            
+            # Try to identify common issues
+            if "found character" in str(e):
+                result['warnings'].append("Invalid characters - may be partially corrupted")
+            elif "expected" in str(e):
+                result['warnings'].append("Syntax error - check indentation and structure")
+
     def validate_files(self, file_paths):
         """Validate multiple files"""
         print(f"🔍 Validating {len(file_paths)} YAML files...")
         
-        for i, file_path in enumerate(file_paths):
-            if i % 50 == 0 and i > 0:
-                print(f"   Processed {i}/{len(file_paths)} files...")
-            
-            result = self.validate_file(Path(file_path))
+        # Recoveries hold many identical copies of a file - validate each
+        # distinct content once and copy the verdict to its duplicates
+        results = [None] * len(file_paths)
+        with ProcessPoolExecutor() as executor:
+            groups = _group_identical(file_paths, executor)
+            if len(groups) < len(file_paths):
+                print(f"   {len(file_paths) - len(groups)} files are identical copies, validating {len(groups)}")
             
+            first_paths = [file_paths[group[0]] for group in groups]
+            group_results = executor.map(_validate_path, first_paths, chunksize=16)
+            for n, (group, result) in enumerate(zip(groups, group_results)):
+                if n % 50 == 0 and n > 0:
+                    print(f"   Processed {n}/{len(groups)} distinct files...")
+                
+                results[group[0]] = result
+                for i in group[1:]:
+                    results[i] = dict(
+                        result,
+                        file=str(Path(file_paths[i])),
+                        warnings=list(result['warnings']),
+                        ha_sections=list(result['ha_sections'])
+                    )
+        
+        for result in results:
             if result['valid']:
                 self.results['valid'].append(result)
             else:
@@ -192,6 +340,16 @@ class HAYAMLValidator:
         
         return "\n".join(report)
 
+# Per-process validator used by the pool workers
+_worker_validator = None
+
+def _validate_path(file_path):
+    """Validate one file inside a worker process"""
+    global _worker_validator
+    if _worker_validator is None:
+        _worker_validator = HAYAMLValidator()
+    return _worker_validator.validate_file(Path(file_path))
+
 def main():
     if len(sys.argv) != 2:
         print("Usage: python validate_yaml_files.py <file_list.txt>")